@@ -1,340 +1,439 @@
 import os
-import math
+import json
+import hmac
+import time
+import asyncio
 import datetime as dt
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import timedelta
+from functools import lru_cache
 from typing import Optional
 from zoneinfo import ZoneInfo
 
-import psycopg
-from fastapi import FastAPI, Header, HTTPException, Query
+import asyncpg
+import numpy as np
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Query
 from pydantic import BaseModel
+from pydantic_settings import BaseSettings
+
 
 # ---------- Config ----------
-API_TOKEN = os.getenv("API_REKEN_TOKEN", "")
-DB_URL = os.getenv("DATABASE_URL", "")
+class Settings(BaseSettings):
+    api_reken_token: str = ""
+    database_url: str = ""
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+API_TOKEN = get_settings().api_reken_token
+DB_URL = get_settings().database_url
+
+_BEARER = "Bearer "
+_API_TOKEN_B = API_TOKEN.encode()     # eenmalig encoden voor compare_digest
 
 TZ = ZoneInfo("Europe/Amsterdam")     # vaste weergave/rekentijdzone
 STAFF_START_HHMM = "11:30"            # eerste kwartier waarin personeel mag starten
 STAFF_END_LAST_SLOT_HHMM = "22:45"    # laatste kwartier-start (einde 23:00)
+STAFF_START_T = dt.time.fromisoformat(STAFF_START_HHMM)
+STAFF_END_LAST_SLOT_T = dt.time.fromisoformat(STAFF_END_LAST_SLOT_HHMM)
 MIN_SHIFT_HOURS = 3                   # minimale dienstduur
+MIN_SHIFT_TD = timedelta(hours=MIN_SHIFT_HOURS)
+SLOT_TD = timedelta(minutes=15)       # kwartier-grid
 MAX_STARTS_PER_SLOT = 1               # max. nieuwe diensten per kwartier
 LATE_BIAS = 0.25                      # zachte voorkeur om afrond-rest later te plaatsen (0..1)
+CACHE_TTL_SECS = 3600.0               # TTL voor in-process caches (uurlonen/forecast)
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 10
+
+# 15m-grid eenmalig opbouwen: alle offsets vanaf 00:00 en de subset die
+# binnen het personeelsvenster valt
+_OFFSETS = tuple(SLOT_TD * i for i in range(96))
+_WINDOW_OFFSETS = tuple(
+    off for off in _OFFSETS
+    if STAFF_START_T <= (dt.datetime.min + off).time() <= STAFF_END_LAST_SLOT_T
+)
+
+DIENSTEN_CACHE_TTL = 60.0             # /diensten/day wordt gepolld; kort cachen volstaat
+
+# in-process caches: key -> (waarde, monotonic vervaltijd)
+_rate_cache: dict = {}                # vandaag (date) -> (blended_rate, expires_at)
+_omzet_cache: dict = {}               # datum (date) -> (omzet_p50, expires_at)
+_diensten_cache: dict = {}            # (datum, rol) -> (response, expires_at)
+
+
+# ---------- Lifespan: asyncpg pool ----------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.pool = None
+    if DB_URL:
+        app.state.pool = await asyncpg.create_pool(
+            DB_URL,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=600,
+        )
 
-app = FastAPI()
+        # warm-up: min_size connecties parallel aanpingen zodat het eerste
+        # echte request geen handshake/cold-start spike meer ziet
+        async def _ping():
+            async with app.state.pool.acquire() as conn:
+                await conn.execute("SELECT 1")
+
+        await asyncio.gather(*(_ping() for _ in range(POOL_MIN_SIZE)))
+    try:
+        yield
+    finally:
+        if app.state.pool is not None:
+            await app.state.pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # ---------- Helpers ----------
 def _auth(authorization: Optional[str]):
     if not API_TOKEN:
         return
-    if not authorization or not authorization.startswith("Bearer "):
+    if not authorization or not authorization.startswith(_BEARER):
         raise HTTPException(status_code=401, detail="Unauthorized")
-    if authorization.split()[1] != API_TOKEN:
+    # constant-time vergelijking tegen timing-gebaseerd token-raden
+    if not hmac.compare_digest(authorization[len(_BEARER):].encode(), _API_TOKEN_B):
         raise HTTPException(status_code=403, detail="Forbidden")
 
 
-def _conn():
-    if not DB_URL:
+def _pool() -> asyncpg.Pool:
+    pool = app.state.pool
+    if pool is None:
         raise HTTPException(status_code=500, detail="DATABASE_URL not set")
-    return psycopg.connect(DB_URL, autocommit=True)
-
-
-def _in_staff_window(ts) -> bool:
-    """ts = tz-aware datetime uit Postgres; check lokale HH:MM binnen personeelsvenster."""
-    tloc = ts.astimezone(TZ)
-    hhmm = tloc.strftime("%H:%M")
-    return (hhmm >= STAFF_START_HHMM) and (hhmm <= STAFF_END_LAST_SLOT_HHMM)
+    return pool
 
 
 def _iso(dtobj):
     return dtobj.astimezone(TZ).isoformat()
 
 
+def _hhmm(dtobj):
+    # sneller dan strftime("%H:%M") (geen format-parsing/locale-machinerie)
+    return f"{dtobj.hour:02d}:{dtobj.minute:02d}"
+
+
+async def _dag_params(conn, d: dt.date):
+    """(omzet_p50, blended_rate) voor één dag; beide via TTL-cache, bij een miss
+    in één gecombineerde round-trip opgehaald. omzet_p50 is None als de
+    forecast ontbreekt; de omzet-cache wordt bij een nieuwe forecast geleegd,
+    de rate-cache is per CURRENT_DATE (uurlonen wijzigen hooguit dagelijks)."""
+    now = time.monotonic()
+    today = dt.date.today()
+    omzet_hit = _omzet_cache.get(d)
+    rate_hit = _rate_cache.get(today)
+    omzet = omzet_hit[0] if omzet_hit and omzet_hit[1] > now else None
+    rate = rate_hit[0] if rate_hit and rate_hit[1] > now else None
+    if omzet is not None and rate is not None:
+        return omzet, rate
+
+    row = await conn.fetchrow("""
+        WITH r AS (
+          SELECT DISTINCT ON (rol) rol, all_in_eur
+          FROM kosten.uurlonen
+          WHERE (geldig_tot IS NULL OR geldig_tot >= CURRENT_DATE)
+          ORDER BY rol, geldig_vanaf DESC
+        )
+        SELECT (SELECT omzet_p50 FROM prognose.dag WHERE datum=$1) AS omzet_p50,
+               (SELECT AVG(all_in_eur)::numeric FROM r) AS blended_rate
+    """, d)
+    if omzet is None and row["omzet_p50"]:
+        omzet = float(row["omzet_p50"])
+        _omzet_cache[d] = (omzet, now + CACHE_TTL_SECS)
+    if rate is None:
+        rate = float(row["blended_rate"] or 0)
+        if rate > 0:
+            _rate_cache.clear()  # hooguit één geldige dag-key
+            _rate_cache[today] = (rate, now + CACHE_TTL_SECS)
+    return omzet, rate
+
+
 # ---------- Models ----------
 class ForecastPayload(BaseModel):
-    date: str  # "YYYY-MM-DD"
+    date: dt.date  # "YYYY-MM-DD"; Pydantic parst en geeft 422 bij onzin
 
 
 class OptimizePayload(BaseModel):
-    date: str
+    date: dt.date
     doel_pct: float = 0.23
     rol: str = "balie"
 
 
 # ---------- Meta/health ----------
 @app.get("/__version__")
-def ver():
+async def ver():
     return {"v": "auto-optimizer-no-template-nl-tzfix"}
 
 
 @app.get("/healthz")
-def healthz():
+async def healthz():
     return {"ok": True}
 
 
 # ---------- Forecast ----------
 @app.post("/forecast/day")
-def forecast(payload: ForecastPayload, authorization: Optional[str] = Header(None)):
+async def forecast(payload: ForecastPayload, authorization: Optional[str] = Header(None)):
     _auth(authorization)
     d = payload.date
-    with _conn() as conn, conn.cursor() as cur:
-        # dag-P50/P80 op basis van DOW
-        cur.execute("""
-            WITH dag_hist AS (
-              SELECT date(start_ts) AS dag, SUM(omzet) AS dag_omzet
-              FROM rapportage.omzet_15m
-              GROUP BY 1
-            ),
-            by_dow AS (
-              SELECT CAST(EXTRACT(DOW FROM dag) AS int) AS dow,
-                     AVG(dag_omzet)::numeric(12,2) AS avg_omzet
-              FROM dag_hist GROUP BY 1
-            )
-            INSERT INTO prognose.dag(datum, omzet_p50, omzet_p80)
-            SELECT %s::date,
-                   COALESCE((SELECT avg_omzet FROM by_dow
-                             WHERE dow = CAST(EXTRACT(DOW FROM %s::date) AS int)), 0),
-                   COALESCE((SELECT avg_omzet*1.1 FROM by_dow
-                             WHERE dow = CAST(EXTRACT(DOW FROM %s::date) AS int)), 0)
-            ON CONFLICT (datum) DO NOTHING;
-        """, (d, d, d))
-
-        # 15m-profiel (NL-tijd); fallback uniform
-        cur.execute("""
-            WITH hist AS (
-              SELECT (start_ts::time) AS tod,
-                     CAST(EXTRACT(DOW FROM dag) AS int) AS dow,
-                     AVG(aandeel)::numeric(10,6) AS a50
-              FROM rapportage.omzet_profiel_15m
-              GROUP BY 1,2
-            )
-            INSERT INTO prognose.profiel_15m(datum, start_ts, aandeel_p50, aandeel_p80)
-            SELECT %s::date AS datum,
-                   (%s::date + tod) AT TIME ZONE 'Europe/Amsterdam' AS start_ts,
-                   COALESCE(a50, 1.0/96), COALESCE(a50, 1.0/96)
-            FROM hist
-            WHERE dow = CAST(EXTRACT(DOW FROM %s::date) AS int)
-            ON CONFLICT (datum, start_ts) DO NOTHING;
-        """, (d, d, d))
-
-        cur.execute("SELECT COUNT(*) FROM prognose.profiel_15m WHERE datum=%s", (d,))
-        if (cur.fetchone()[0] or 0) == 0:
-            cur.execute("""
+    pool = _pool()
+
+    # dag-P50/P80 op basis van DOW (mv_by_dow: zie sql/002, nachtelijks ververst)
+    async def _upsert_dag():
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO prognose.dag(datum, omzet_p50, omzet_p80)
+                SELECT $1::date, COALESCE(avg_omzet, 0), COALESCE(avg_omzet*1.1, 0)
+                FROM (SELECT CAST(EXTRACT(DOW FROM $1::date) AS int) AS dow) q
+                LEFT JOIN rapportage.mv_by_dow USING (dow)
+                ON CONFLICT (datum) DO NOTHING;
+            """, d)
+
+    # 15m-profiel (NL-tijd); uniform fallback zit in hetzelfde statement
+    # (UNION ALL-tak die alleen rijen levert als er geen DOW-historie is)
+    async def _upsert_profiel():
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                WITH dow_hist AS (
+                  SELECT tod, a50 FROM rapportage.mv_profiel_dow
+                  WHERE dow = CAST(EXTRACT(DOW FROM $1::date) AS int)
+                )
                 INSERT INTO prognose.profiel_15m(datum, start_ts, aandeel_p50, aandeel_p80)
-                SELECT dd::date,
-                       gs AS start_ts,
-                       1.0/96, 1.0/96
-                FROM (SELECT %s::date AS dd) x,
-                     generate_series(
-                        (%s::date) AT TIME ZONE 'Europe/Amsterdam',
-                        (%s::date + time '23:45') AT TIME ZONE 'Europe/Amsterdam',
-                        interval '15 minutes'
+                SELECT $1::date AS datum,
+                       ($1::date + tod) AT TIME ZONE 'Europe/Amsterdam' AS start_ts,
+                       COALESCE(a50, 1.0/96), COALESCE(a50, 1.0/96)
+                FROM dow_hist
+                UNION ALL
+                SELECT $1::date, gs, 1.0/96, 1.0/96
+                FROM generate_series(
+                       ($1::date) AT TIME ZONE 'Europe/Amsterdam',
+                       ($1::date + time '23:45') AT TIME ZONE 'Europe/Amsterdam',
+                       interval '15 minutes'
                      ) AS gs
-            """, (d, d, d))
+                WHERE NOT EXISTS (SELECT 1 FROM dow_hist)
+                ON CONFLICT (datum, start_ts) DO NOTHING;
+            """, d)
 
-    return {"ok": True, "date": d}
+    # onafhankelijke schrijfacties: parallel op twee pool-connecties
+    await asyncio.gather(_upsert_dag(), _upsert_profiel())
+
+    _omzet_cache.pop(d, None)  # nieuwe forecast geschreven
+    return {"ok": True, "date": d.isoformat()}
 
 
 # ---------- Optimize (geen templates) ----------
+async def _write_plan(d, rol, demand_rows, blok_rows, dienst_rows,
+                      omzet_p50, geplande_kosten, geplande_pct):
+    """Schrijffase van /optimize/day; draait als background task na de response, atomisch."""
+    pool = app.state.pool
+    if pool is None:
+        return
+    async with pool.acquire() as conn, conn.transaction():
+        # dag-deletes in één statement (writable CTE's): één round-trip.
+        # demand_15m wordt geüpsert (zie onder), dus daar wissen we alleen
+        # slots die buiten het huidige grid vallen
+        await conn.execute("""
+            WITH del_demand AS (
+              DELETE FROM planning.demand_15m
+              WHERE datum=$1 AND rol=$2
+                AND NOT (start_ts = ANY($3::timestamptz[]))
+            ), del_diensten AS (
+              DELETE FROM planning.diensten_voorstel WHERE datum=$1 AND rol=$2 AND bron='auto'
+            )
+            DELETE FROM planning.voorstel_shifts WHERE datum=$1 AND bron='auto'
+        """, d, rol, [r[1] for r in demand_rows])
+
+        if demand_rows:
+            # upsert i.p.v. delete+insert: ongewijzigde slots zijn no-ops
+            # (de WHERE voorkomt lege updates → geen dead tuples/WAL);
+            # vereist de unieke index uit sql/006
+            await conn.executemany("""
+                INSERT INTO planning.demand_15m(datum, start_ts, rol, heads_needed)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (datum, rol, start_ts) DO UPDATE
+                  SET heads_needed = EXCLUDED.heads_needed
+                  WHERE demand_15m.heads_needed IS DISTINCT FROM EXCLUDED.heads_needed
+            """, demand_rows)
+
+        if dienst_rows:
+            await conn.executemany(
+                "INSERT INTO planning.diensten_voorstel(datum,rol,start_ts,eind_ts,bron) VALUES ($1,$2,$3,$4,'auto')",
+                dienst_rows,
+            )
+
+        if blok_rows:
+            await conn.copy_records_to_table(
+                "voorstel_shifts",
+                schema_name="planning",
+                records=blok_rows,
+                columns=["datum", "medewerker_id", "rol", "start_ts", "eind_ts", "bron", "objective_note"],
+            )
+
+        await conn.execute("""
+            INSERT INTO planning.kpi_dag(datum, omzet_forecast_p50, geplande_kosten, geplande_pct, updated_at)
+            VALUES ($1, $2, $3, $4, now())
+            ON CONFLICT (datum) DO UPDATE SET
+              omzet_forecast_p50=EXCLUDED.omzet_forecast_p50,
+              geplande_kosten=EXCLUDED.geplande_kosten,
+              geplande_pct=EXCLUDED.geplande_pct,
+              updated_at=now()
+        """, d, omzet_p50, geplande_kosten, geplande_pct)
+
+    _diensten_cache.pop((d, rol), None)  # voorstel gewijzigd
+
+
 @app.post("/optimize/day")
-def optimize(payload: OptimizePayload, authorization: Optional[str] = Header(None)):
+async def optimize(
+    payload: OptimizePayload,
+    background_tasks: BackgroundTasks,
+    authorization: Optional[str] = Header(None),
+):
     _auth(authorization)
     d = payload.date
     doel_pct = float(payload.doel_pct)
     rol = payload.rol
 
-    with _conn() as conn, conn.cursor() as cur:
-        # omzet & blended rate
-        cur.execute("SELECT omzet_p50 FROM prognose.dag WHERE datum=%s", (d,))
-        row = cur.fetchone()
-        if not row or not row[0]:
+    # -- leesfase: alleen SELECTs (en evt. de idempotente profiel-backfill) --
+    async with _pool().acquire() as conn:
+        # omzet & blended rate: één round-trip, beide via TTL-cache
+        omzet_p50, blended_rate = await _dag_params(conn, d)
+        if not omzet_p50:
             raise HTTPException(status_code=400, detail="Forecast ontbreekt of is 0 voor die datum")
-        omzet_p50 = float(row[0])
-
-        cur.execute("""
-            WITH r AS (
-              SELECT DISTINCT ON (rol) rol, all_in_eur
-              FROM kosten.uurlonen
-              WHERE (geldig_tot IS NULL OR geldig_tot >= CURRENT_DATE)
-              ORDER BY rol, geldig_vanaf DESC
-            )
-            SELECT AVG(all_in_eur)::numeric FROM r;
-        """)
-        blended_rate = float((cur.fetchone()[0] or 0))
         if blended_rate <= 0:
             raise HTTPException(status_code=400, detail="Geen geldige uurlonen gevonden")
 
         target_uren_dag = (doel_pct * omzet_p50) / blended_rate  # uren die we mogen plannen
 
-        # profiel ophalen (NL-tijd), 96 rijen garanderen
-        cur.execute("SELECT start_ts, aandeel_p50 FROM prognose.profiel_15m WHERE datum=%s ORDER BY start_ts", (d,))
-        profiel = cur.fetchall()
+        # profiel binnen personeelsvenster, genormaliseerd in SQL (window-sum);
+        # w is NULL zodra de venstersom 0 is
+        profiel = await conn.fetch("""
+            SELECT start_ts,
+                   GREATEST(aandeel_p50, 0)
+                     / NULLIF(SUM(GREATEST(aandeel_p50, 0)) OVER (), 0) AS w
+            FROM prognose.profiel_15m
+            WHERE datum = $1
+              AND (start_ts AT TIME ZONE 'Europe/Amsterdam')::time BETWEEN $2 AND $3
+            ORDER BY start_ts
+        """, d, STAFF_START_T, STAFF_END_LAST_SLOT_T)
+
         if not profiel:
-            cur.execute("""
+            # self-healing: uniform profiel wegschrijven voor volgende lezers
+            # (idempotent; no-op als er al iets staat), maar lokaal meteen
+            # uniform doorrekenen i.p.v. de 96 rijen terug te lezen
+            await conn.execute("""
                 INSERT INTO prognose.profiel_15m(datum, start_ts, aandeel_p50, aandeel_p80)
-                SELECT dd::date, gs, 1.0/96, 1.0/96
-                FROM (SELECT %s::date AS dd) x,
-                     generate_series(
-                        (%s::date) AT TIME ZONE 'Europe/Amsterdam',
-                        (%s::date + time '23:45') AT TIME ZONE 'Europe/Amsterdam',
-                        interval '15 minutes'
+                SELECT $1::date, gs, 1.0/96, 1.0/96
+                FROM generate_series(
+                       ($1::date) AT TIME ZONE 'Europe/Amsterdam',
+                       ($1::date + time '23:45') AT TIME ZONE 'Europe/Amsterdam',
+                       interval '15 minutes'
                      ) AS gs
+                WHERE NOT EXISTS (SELECT 1 FROM prognose.profiel_15m WHERE datum = $1)
                 ON CONFLICT DO NOTHING
-            """, (d, d, d))
-            cur.execute("SELECT start_ts, aandeel_p50 FROM prognose.profiel_15m WHERE datum=%s ORDER BY start_ts", (d,))
-            profiel = cur.fetchall()
-
-        # 1) fract. behoefte per kwartier binnen personeelsvenster
-        times = []
-        need_f = []
-        w_sum = 0.0
-        for ts, a in profiel:
-            if _in_staff_window(ts):
-                times.append(ts)
-                val = max(0.0, float(a or 0))
-                need_f.append(val)
-                w_sum += val
-
-        # als niets binnen venster: leeg resultaat
-        if w_sum == 0:
-            cur.execute("DELETE FROM planning.demand_15m WHERE datum=%s AND rol=%s", (d, rol))
-            cur.execute("DELETE FROM planning.diensten_voorstel WHERE datum=%s AND rol=%s AND bron='auto'", (d, rol))
-            cur.execute("""
-                INSERT INTO planning.kpi_dag(datum, omzet_forecast_p50, geplande_kosten, geplande_pct, updated_at)
-                VALUES (%s, %s, 0, 0, now())
-                ON CONFLICT (datum) DO UPDATE SET
-                  omzet_forecast_p50=EXCLUDED.omzet_forecast_p50,
-                  geplande_kosten=0,
-                  geplande_pct=0,
-                  updated_at=now()
-            """, (d, omzet_p50))
-            return {"ok": True, "date": d, "target_uren_dag": 0.0, "geplande_uren_dag": 0.0}
-
-        # schaal naar kwartier-koppen (uren * 4)
-        scale = (target_uren_dag * 4.0) / w_sum
-        need_f = [x * scale for x in need_f]  # fractional koppen per slot
-
-        # 2) integeriseren met zachte late-bias
-        base = [int(math.floor(x)) for x in need_f]
-        remainder = int(round(sum(need_f))) - sum(base)
-        if remainder > 0:
-            N = max(1, len(need_f) - 1)
-            scored = []
-            for i, x in enumerate(need_f):
-                frac = x - base[i]
-                bias = 1.0 + LATE_BIAS * (i / N)  # later op de dag iets zwaarder
-                scored.append((i, frac * bias))
-            scored.sort(key=lambda p: p[1], reverse=True)
-            j = 0
-            for _ in range(remainder):
-                idx = scored[j % len(scored)][0]
-                base[idx] += 1
-                j += 1
-        elif remainder < 0:
-            scored = [(i, (x - base[i])) for i, x in enumerate(need_f)]
-            scored.sort(key=lambda p: p[1])
-            j = 0
-            for _ in range(-remainder):
-                idx = scored[j % len(scored)][0]
+            """, d)
+
+    # -- rekenfase: puur Python/NumPy, geen connectie meer vast --
+    # 1) fract. behoefte per kwartier binnen personeelsvenster; gewichten
+    #    direct als ndarray uit de records (geen tussenliggende lists)
+    if profiel:
+        times = [r[0] for r in profiel]
+        weights = np.fromiter(
+            (float(r[1]) if r[1] is not None else 0.0 for r in profiel),
+            dtype=np.float64, count=len(profiel),
+        )
+    else:
+        day0 = dt.datetime.combine(d, dt.time.min, tzinfo=TZ)
+        times = [day0 + off for off in _WINDOW_OFFSETS]
+        weights = np.full(len(times), 1.0 / len(times)) if times else np.empty(0)
+
+    # als niets binnen venster: leeg resultaat wegschrijven op de achtergrond
+    if not times or weights.sum() == 0:
+        background_tasks.add_task(_write_plan, d, rol, [], [], [], omzet_p50, 0.0, 0.0)
+        return {"ok": True, "date": d.isoformat(), "target_uren_dag": 0.0, "geplande_uren_dag": 0.0}
+
+    # 2) schaal naar kwartier-koppen (uren * 4; gewichten sommeren al tot 1)
+    #    en integeriseer met zachte late-bias (largest fractions, gevectoriseerd)
+    raw = weights * (target_uren_dag * 4.0)  # fractional koppen per slot
+    base = np.floor(raw).astype(np.int64)
+    remainder = int(round(raw.sum())) - int(base.sum())
+    if remainder > 0:
+        n = raw.size
+        bias = 1.0 + LATE_BIAS * (np.arange(n) / max(1, n - 1))  # later op de dag iets zwaarder
+        order = np.argsort(-(raw - base) * bias, kind="stable")
+        base[order[:remainder]] += 1
+    elif remainder < 0:
+        order = np.argsort(raw - base, kind="stable")
+        while remainder < 0 and base.sum() > 0:
+            for idx in order:
                 if base[idx] > 0:
                     base[idx] -= 1
-                j += 1
-
-        need = base[:]                         # integer koppen per kwartier
-        planned_blocks = sum(need)             # kop-kwartieren
-        geplande_uren_dag = planned_blocks / 4.0
-
-        # 3) demand wegschrijven
-        cur.execute("DELETE FROM planning.demand_15m WHERE datum=%s AND rol=%s", (d, rol))
-        for ts, k in zip(times, need):
-            cur.execute(
-                "INSERT INTO planning.demand_15m(datum, start_ts, rol, heads_needed) VALUES (%s, %s, %s, %s)",
-                (d, ts, rol, int(k)),
-            )
-
-        # 4) diensten bouwen met staggered starts + min. 3u + hard dag-einde 23:00 NL-tijd
-        cur.execute(
-            "DELETE FROM planning.diensten_voorstel WHERE datum=%s AND rol=%s AND bron='auto'",
-            (d, rol)
-        )
-        active = []          # start_ts van open diensten
-        backlog_open = 0     # extra opens die we doorschuiven vanwege MAX_STARTS_PER_SLOT
-
-        for ts, k in zip(times, need):
-            required = k + backlog_open
-            delta = required - len(active)
-
-            # openen (stagger)
-            if delta > 0:
-                opens = min(delta, MAX_STARTS_PER_SLOT)
-                for _ in range(opens):
-                    active.append(ts)
-                backlog_open = delta - opens
-            else:
-                backlog_open = 0
-
-            # sluiten (min. 3 uur)
-            to_close = len(active) - k
-            if to_close > 0:
-                closed_now = 0
-                i = 0
-                while i < len(active) and closed_now < to_close:
-                    s = active[i]
-                    if (ts - s) >= timedelta(hours=MIN_SHIFT_HOURS):
-                        cur.execute(
-                            "INSERT INTO planning.diensten_voorstel(datum,rol,start_ts,eind_ts,bron) VALUES (%s,%s,%s,%s,'auto')",
-                            (d, rol, s, ts)
-                        )
-                        active.pop(i)
-                        closed_now += 1
-                        continue
-                    i += 1
-                # als niemand 3u heeft: tijdelijk overbezet; eind-afhandeling fixt dit
-
-        # dag-einde: expliciet 23:00 lokale tijd (Europe/Amsterdam)
-        if times:
-            d_date = dt.date.fromisoformat(d)
-            day_end = dt.datetime(d_date.year, d_date.month, d_date.day, 23, 0, tzinfo=TZ)
-            for s in active:
-                end = max(s + timedelta(hours=MIN_SHIFT_HOURS), day_end)
-                if end > day_end:
-                    end = day_end
-                cur.execute(
-                    "INSERT INTO planning.diensten_voorstel(datum,rol,start_ts,eind_ts,bron) VALUES (%s,%s,%s,%s,'auto')",
-                    (d, rol, s, end)
-                )
-
-        # 5) compat: blok-output met integer koppen
-        cur.execute("DELETE FROM planning.voorstel_shifts WHERE datum=%s AND bron='auto'", (d,))
-        need_map = {t: n for t, n in zip(times, need)}
-        for ts, _a in profiel:
-            if not _in_staff_window(ts):
-                continue
-            n = need_map.get(ts, 0)
-            cur.execute("""
-                INSERT INTO planning.voorstel_shifts
-                  (datum, medewerker_id, rol, start_ts, eind_ts, bron, objective_note)
-                VALUES
-                  (%s, NULL, %s, %s, %s, 'auto', %s)
-            """, (d, rol, ts, ts + timedelta(minutes=15), f"int_koppen={n}"))
-
-        # 6) KPI
-        geplande_kosten = geplande_uren_dag * blended_rate
-        geplande_pct = (geplande_kosten / omzet_p50) * 100 if omzet_p50 else None
-
-        cur.execute("""
-            INSERT INTO planning.kpi_dag(datum, omzet_forecast_p50, geplande_kosten, geplande_pct, updated_at)
-            VALUES (%s, %s, %s, %s, now())
-            ON CONFLICT (datum) DO UPDATE SET
-              omzet_forecast_p50=EXCLUDED.omzet_forecast_p50,
-              geplande_kosten=EXCLUDED.geplande_kosten,
-              geplande_pct=EXCLUDED.geplande_pct,
-              updated_at=now()
-        """, (d, omzet_p50, geplande_kosten, geplande_pct))
-
+                    remainder += 1
+                    if remainder == 0:
+                        break
+
+    need = base.tolist()                   # integer koppen per kwartier
+    planned_blocks = sum(need)             # kop-kwartieren
+    geplande_uren_dag = planned_blocks / 4.0
+
+    # 3) demand- en compat-blokrijen in één pass opbouwen
+    demand_rows = []
+    blok_rows = []
+    for ts, k in zip(times, need):
+        demand_rows.append((d, ts, rol, k))
+        blok_rows.append((d, None, rol, ts, ts + SLOT_TD, "auto",
+                          json.dumps({"int_koppen": k})))
+
+    # 4) diensten bouwen met staggered starts + min. 3u + hard dag-einde 23:00 NL-tijd
+    active = deque()     # start_ts van open diensten (FIFO: oudste vooraan)
+    backlog_open = 0     # extra opens die we doorschuiven vanwege MAX_STARTS_PER_SLOT
+    dienst_rows = []     # (datum, rol, start_ts, eind_ts)
+
+    for ts, k in zip(times, need):
+        required = k + backlog_open
+        delta = required - len(active)
+
+        # openen (stagger)
+        if delta > 0:
+            opens = min(delta, MAX_STARTS_PER_SLOT)
+            for _ in range(opens):
+                active.append(ts)
+            backlog_open = delta - opens
+        else:
+            backlog_open = 0
+
+        # sluiten (min. 3 uur); starts zijn oplopend, dus de oudste is
+        # altijd als eerste sluitbaar — O(1) popleft i.p.v. lineaire scan
+        while len(active) > k and (ts - active[0]) >= MIN_SHIFT_TD:
+            dienst_rows.append((d, rol, active.popleft(), ts))
+        # als niemand 3u heeft: tijdelijk overbezet; eind-afhandeling fixt dit
+
+    # dag-einde: expliciet 23:00 lokale tijd (Europe/Amsterdam)
+    day_end = dt.datetime(d.year, d.month, d.day, 23, 0, tzinfo=TZ)
+    for s in active:
+        end = max(s + MIN_SHIFT_TD, day_end)
+        if end > day_end:
+            end = day_end
+        dienst_rows.append((d, rol, s, end))
+
+    # 5) KPI
+    geplande_kosten = geplande_uren_dag * blended_rate
+    geplande_pct = (geplande_kosten / omzet_p50) * 100 if omzet_p50 else None
+
+    # -- schrijffase: na de response, in één transactie (zie _write_plan) --
+    background_tasks.add_task(
+        _write_plan, d, rol, demand_rows, blok_rows, dienst_rows,
+        omzet_p50, geplande_kosten, geplande_pct,
+    )
     return {
         "ok": True,
-        "date": d,
+        "date": d.isoformat(),
         "target_uren_dag": round(float(target_uren_dag), 2),
         "geplande_uren_dag": round(float(geplande_uren_dag), 2),
         "blended_rate": round(float(blended_rate), 2),
@@ -345,21 +444,25 @@ def optimize(payload: OptimizePayload, authorization: Optional[str] = Header(Non
 
 # ---------- Read: diensten (day) ----------
 @app.get("/diensten/day")
-def diensten_day(
-    date: str = Query(..., description="YYYY-MM-DD"),
+async def diensten_day(
+    date: dt.date = Query(..., description="YYYY-MM-DD"),
     rol: str = Query("balie"),
     authorization: Optional[str] = Header(None),
 ):
     _auth(authorization)
-    with _conn() as conn, conn.cursor() as cur:
+    key = (date, rol)
+    hit = _diensten_cache.get(key)
+    if hit and hit[1] > time.monotonic():
+        return hit[0]
+
+    async with _pool().acquire() as conn:
         # ruwe timestamptz ophalen (geen AT TIME ZONE in SQL)
-        cur.execute("""
+        rows = await conn.fetch("""
             SELECT id, datum, rol, start_ts, eind_ts, bron
             FROM planning.diensten_voorstel
-            WHERE datum=%s AND rol=%s
+            WHERE datum=$1 AND rol=$2
             ORDER BY start_ts
-        """, (date, rol))
-        rows = cur.fetchall()
+        """, date, rol)
 
         diensten = []
         total_secs = 0.0
@@ -368,8 +471,10 @@ def diensten_day(
         for _id, datum, _rol, s_ts, e_ts, bron in rows:
             s_loc = s_ts.astimezone(TZ)
             e_loc = e_ts.astimezone(TZ)
-            dur_h = (e_loc - s_loc).total_seconds() / 3600.0
-            total_secs += (e_loc - s_loc).total_seconds()
+            # duur direct op de ruwe timestamptz's; tz-conversie is puur weergave
+            dur_secs = (e_ts - s_ts).total_seconds()
+            dur_h = dur_secs / 3600.0
+            total_secs += dur_secs
             if first is None or s_loc < first:
                 first = s_loc
             if last is None or e_loc > last:
@@ -380,22 +485,29 @@ def diensten_day(
                 "rol": _rol,
                 "start_ts": s_loc.isoformat(),
                 "eind_ts":  e_loc.isoformat(),
-                "start_hhmm": s_loc.strftime("%H:%M"),
-                "eind_hhmm":  e_loc.strftime("%H:%M"),
+                "start_hhmm": _hhmm(s_loc),
+                "eind_hhmm":  _hhmm(e_loc),
                 "duur_uren": round(dur_h, 2),
                 "bron": bron,
             })
 
-        return {
+        resp = {
             "ok": True,
             "timezone": "Europe/Amsterdam",
-            "date": date,
+            "date": date.isoformat(),
             "rol": rol,
             "dienst_count": len(diensten),
             "totaal_uren": round(total_secs / 3600.0, 2),
             "eerste_start": first.isoformat() if first else None,
             "laatste_einde": last.isoformat() if last else None,
-            "eerste_start_hhmm": first.strftime("%H:%M") if first else None,
-            "laatste_einde_hhmm": last.strftime("%H:%M") if last else None,
+            "eerste_start_hhmm": _hhmm(first) if first else None,
+            "laatste_einde_hhmm": _hhmm(last) if last else None,
             "diensten": diensten,
         }
+
+        now = time.monotonic()
+        if len(_diensten_cache) > 256:  # verlopen entries opruimen
+            for k in [k for k, v in _diensten_cache.items() if v[1] <= now]:
+                del _diensten_cache[k]
+        _diensten_cache[key] = (resp, now + DIENSTEN_CACHE_TTL)
+        return resp
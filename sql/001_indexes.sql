@@ -0,0 +1,14 @@
+-- Indexen voor de hot paths van /optimize/day en /diensten/day.
+-- Eénmalig draaien (idempotent): psql "$DATABASE_URL" -f sql/001_indexes.sql
+
+CREATE INDEX IF NOT EXISTS ix_demand_15m_datum_rol_ts
+    ON planning.demand_15m (datum, rol, start_ts);
+
+CREATE INDEX IF NOT EXISTS ix_profiel_15m_datum_ts
+    ON prognose.profiel_15m (datum, start_ts);
+
+CREATE INDEX IF NOT EXISTS ix_dv_datum_rol_bron
+    ON planning.diensten_voorstel (datum, rol, bron);
+
+CREATE INDEX IF NOT EXISTS ix_vs_datum_bron
+    ON planning.voorstel_shifts (datum, bron);
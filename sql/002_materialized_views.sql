@@ -0,0 +1,28 @@
+-- Gematerialiseerde DOW-aggregaten voor /forecast/day, zodat de endpoint
+-- niet per call de volledige omzet-historie hoeft te aggregeren.
+-- Eénmalig draaien: psql "$DATABASE_URL" -f sql/002_materialized_views.sql
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS rapportage.mv_by_dow AS
+  SELECT CAST(EXTRACT(DOW FROM dag) AS int) AS dow,
+         AVG(dag_omzet)::numeric(12,2) AS avg_omzet
+  FROM (SELECT date(start_ts) AS dag, SUM(omzet) AS dag_omzet
+        FROM rapportage.omzet_15m
+        GROUP BY 1) x
+  GROUP BY 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_by_dow ON rapportage.mv_by_dow (dow);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS rapportage.mv_profiel_dow AS
+  SELECT (start_ts::time) AS tod,
+         CAST(EXTRACT(DOW FROM dag) AS int) AS dow,
+         AVG(aandeel)::numeric(10,6) AS a50
+  FROM rapportage.omzet_profiel_15m
+  GROUP BY 1, 2;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_profiel_dow ON rapportage.mv_profiel_dow (dow, tod);
+
+-- Nachtelijks verversen, bijv. met pg_cron:
+--   SELECT cron.schedule('refresh_rekenservice_mvs', '15 3 * * *', $$
+--     REFRESH MATERIALIZED VIEW CONCURRENTLY rapportage.mv_by_dow;
+--     REFRESH MATERIALIZED VIEW CONCURRENTLY rapportage.mv_profiel_dow;
+--   $$);
@@ -0,0 +1,12 @@
+-- objective_note als gestructureerde jsonb i.p.v. geformatteerde tekst,
+-- zodat o.a. int_koppen direct queryable is.
+-- Eénmalig draaien: psql "$DATABASE_URL" -f sql/003_objective_note_jsonb.sql
+
+ALTER TABLE planning.voorstel_shifts
+  ALTER COLUMN objective_note TYPE jsonb
+  USING CASE
+    WHEN objective_note IS NULL THEN NULL
+    WHEN objective_note ~ '^int_koppen=\d+$'
+      THEN jsonb_build_object('int_koppen', split_part(objective_note, '=', 2)::int)
+    ELSE to_jsonb(objective_note)
+  END;
@@ -0,0 +1,7 @@
+-- Covering index voor /diensten/day (WHERE datum+rol ORDER BY start_ts)
+-- en de delete-by-day in /optimize/day. Vervangt in de praktijk
+-- ix_dv_datum_rol_bron uit sql/001 als sorteervriendelijke variant.
+-- Eénmalig draaien: psql "$DATABASE_URL" -f sql/004_diensten_voorstel_index.sql
+
+CREATE INDEX IF NOT EXISTS ix_dv_datum_rol_ts
+    ON planning.diensten_voorstel (datum, rol, start_ts);
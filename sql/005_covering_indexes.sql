@@ -0,0 +1,19 @@
+-- Upgrade van de indexen uit sql/001 en sql/004 naar covering varianten
+-- (INCLUDE) zodat de hot reads index-only scans worden.
+-- Eénmalig draaien: psql "$DATABASE_URL" -f sql/005_covering_indexes.sql
+
+DROP INDEX IF EXISTS planning.ix_demand_15m_datum_rol_ts;
+CREATE INDEX IF NOT EXISTS ix_demand_15m_datum_rol_ts
+    ON planning.demand_15m (datum, rol, start_ts) INCLUDE (heads_needed);
+
+DROP INDEX IF EXISTS prognose.ix_profiel_15m_datum_ts;
+CREATE INDEX IF NOT EXISTS ix_profiel_15m_datum_ts
+    ON prognose.profiel_15m (datum, start_ts) INCLUDE (aandeel_p50);
+
+DROP INDEX IF EXISTS planning.ix_dv_datum_rol_ts;
+CREATE INDEX IF NOT EXISTS ix_dv_datum_rol_ts
+    ON planning.diensten_voorstel (datum, rol, start_ts) INCLUDE (eind_ts, bron);
+
+ANALYZE planning.demand_15m;
+ANALYZE prognose.profiel_15m;
+ANALYZE planning.diensten_voorstel;
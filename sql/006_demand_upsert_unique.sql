@@ -0,0 +1,16 @@
+-- Unieke sleutel op planning.demand_15m zodat /optimize/day kan upserten
+-- (ON CONFLICT) i.p.v. delete+insert. Vervangt de covering index uit
+-- sql/005 door een unieke variant (INCLUDE blijft voor index-only scans).
+-- Eénmalig draaien: psql "$DATABASE_URL" -f sql/006_demand_upsert_unique.sql
+
+-- eventuele dubbelen eerst opruimen, anders faalt de unieke index
+DELETE FROM planning.demand_15m a
+USING planning.demand_15m b
+WHERE a.ctid < b.ctid
+  AND a.datum = b.datum AND a.rol = b.rol AND a.start_ts = b.start_ts;
+
+DROP INDEX IF EXISTS planning.ix_demand_15m_datum_rol_ts;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_demand_15m_datum_rol_ts
+    ON planning.demand_15m (datum, rol, start_ts) INCLUDE (heads_needed);
+
+ANALYZE planning.demand_15m;